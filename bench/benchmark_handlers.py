@@ -0,0 +1,578 @@
+"""Offline benchmark and replay harness for the Lambda templates.
+
+Replays synthetic (or recorded) events into each ``lambda_handler`` while every
+AWS API call is served by moto. A botocore ``before-call`` hook sits in front of
+moto and injects configurable per-call latency and error rates, so the numbers
+look like a Lambda talking to a real (slow, occasionally failing) AWS.
+
+Reported per handler:
+- cold wall time (module import + first invocation)
+- warm wall time p50/p95/p99 of successful invocations, and of failed ones,
+  per event type (HTTP method + path, or detail-type / action) and overall
+- failed invocations: exceptions, statusCode >= 500, error bodies, or any
+  injected AWS error (handlers often swallow those)
+- AWS API call counts (total and per operation)
+- handler memory: live allocations made by the handler file itself at the end
+  of an invocation, and the whole-process traced peak (mostly moto)
+
+Requirements (not needed by the Lambdas themselves):
+    pip install boto3 "moto[ec2,route53,acm,ssm]"
+
+Examples:
+    python bench/benchmark_handlers.py
+    python bench/benchmark_handlers.py --handler ec2-panel --latency-ms 40 --error-rate 0.02
+    python bench/benchmark_handlers.py --handler vpn-check --events recorded.json
+    python bench/benchmark_handlers.py --json bench.json --baseline main.json --max-regression 25
+"""
+import argparse
+import collections
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from unittest import mock
+
+# Keep a handle on the real sleep: time.sleep is patched while handlers run,
+# but injected latency must still be real wall time.
+_real_sleep = time.sleep
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLER_DIR = os.path.join(REPO_ROOT, 'python')
+BENCH_REGION = 'us-east-1'
+BENCH_ALT_REGIONS = ['us-west-2', 'eu-west-1']
+BENCH_GROUP = 'bench-group'
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+
+def use_fake_credentials():
+    """Make sure nothing can reach real AWS, even if moto misses a service"""
+    os.environ.update({
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SECURITY_TOKEN': 'testing',
+        'AWS_SESSION_TOKEN': 'testing',
+        'AWS_DEFAULT_REGION': BENCH_REGION,
+    })
+
+
+class AwsStandIn:
+    """Latency/error injector and call counter hooked into every botocore call
+
+    Handlers call AWS from worker threads (ec2-panel group actions and idle
+    check), so counters are locked and random draws come from one RNG per
+    (operation, region) seeded from --seed. Calls for one operation in one
+    region are sequential, which keeps runs reproducible whatever the thread
+    scheduling.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 error_code='ThrottlingException', op_latency=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.op_latency = op_latency or {}
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.rngs = {}
+        self.calls = collections.Counter()
+        self.errors = collections.Counter()
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def error_snapshot(self):
+        """Copy of the injected error counts, to diff around one invocation"""
+        with self.lock:
+            return collections.Counter(self.errors)
+
+    def before_call(self, model, request_signer=None, **kwargs):
+        operation = f"{model.service_model.service_name}.{model.name}"
+        region = getattr(request_signer, 'region_name', None) or ''
+
+        with self.lock:
+            self.calls[operation] += 1
+            rng = self.rngs.get((operation, region))
+            if rng is None:
+                rng = self.rngs[(operation, region)] = random.Random(f"{self.seed}:{operation}:{region}")
+            jitter = rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = bool(self.error_rate) and rng.random() < self.error_rate
+            if fail:
+                self.errors[operation] += 1
+
+        delay_ms = self.op_latency.get(operation, self.latency_ms) + jitter
+        if delay_ms > 0:
+            _real_sleep(delay_ms / 1000.0)
+
+        if fail:
+            raise ClientError(
+                {'Error': {'Code': self.error_code, 'Message': 'Injected by benchmark harness'}},
+                model.name
+            )
+
+
+class SkippedSleeps:
+    """Stand-in for time.sleep that records the requested seconds instead of waiting"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, seconds):
+        self.seconds += seconds
+
+
+def first_image_id(ec2):
+    images = ec2.describe_images(Owners=['amazon'])['Images']
+    return images[0]['ImageId'] if images else 'ami-12c6146b'
+
+
+def launch_instance(session, region, count=1, tags=None):
+    ec2 = session.client('ec2', region_name=region)
+    params = {
+        'ImageId': first_image_id(ec2),
+        'InstanceType': 't3.micro',
+        'MinCount': count,
+        'MaxCount': count
+    }
+    if tags:
+        params['TagSpecifications'] = [{
+            'ResourceType': 'instance',
+            'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]
+        }]
+    response = ec2.run_instances(**params)
+    return response['Instances'][0]['InstanceId']
+
+
+def setup_ec2_panel(session):
+    instance_id = launch_instance(session, BENCH_REGION)
+    regions = [BENCH_REGION] + BENCH_ALT_REGIONS
+    for region in regions:
+        launch_instance(session, region, count=5, tags={'ControlPanelGroup': BENCH_GROUP})
+    return {
+        'INSTANCE_ID': instance_id,
+        'AWS_ALT_REGION': BENCH_REGION,
+        'MANAGED_REGIONS': ','.join(regions),
+        'GROUP_TAG_KEY': 'ControlPanelGroup',
+        'AUTH_USERNAME': 'bench',
+        'AUTH_PASSWORD_HASH': '',
+        'SESSION_SECRET': 'bench',
+    }
+
+
+def ec2_panel_events():
+    def http_event(path, method='GET', body='', query=''):
+        return {
+            'rawPath': path,
+            'rawQueryString': query,
+            'requestContext': {'http': {'method': method}},
+            'headers': {},
+            'body': body,
+            'isBase64Encoded': False
+        }
+
+    return [
+        http_event('/status'),
+        http_event('/stop'),
+        http_event('/status'),
+        http_event('/start'),
+        http_event('/status'),
+        http_event('/login', 'POST', 'username=bench&password=bench'),
+        http_event('/'),
+        http_event('/group/stop', query=f'group={BENCH_GROUP}&format=json'),
+        http_event('/group/status', query=f'group={BENCH_GROUP}'),
+        http_event('/group/start', query=f'group={BENCH_GROUP}&format=json'),
+        {'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {'dryRun': True}},
+    ]
+
+
+def setup_route53_acm(session):
+    return {
+        'DOMAIN_NAME': 'bench.example.com',
+        'BASE_SUB_DOMAIN': 'client1',
+        'IP_ADDRESS': '10.0.0.10',
+    }
+
+
+def route53_acm_events():
+    return [{}]
+
+
+def setup_vpn_check(session):
+    instance_id = launch_instance(session, BENCH_REGION)
+    return {
+        'EC2_INSTANCE_ID': instance_id,
+        'VPN_TEST_COMM': 'nc -w3 -zvvv',
+        'VPN_RESTART_COMM': 'sudo systemctl restart strongswan',
+        'TARGET_IP': '10.0.1.100',
+        'PORT': '22',
+    }
+
+
+def vpn_check_events():
+    return [{'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {}}]
+
+
+HANDLERS = {
+    'ec2-panel': {
+        'file': 'EC2-StartStopStatus-Simple-Auth.py',
+        'setup': setup_ec2_panel,
+        'events': ec2_panel_events,
+        'error_markers': ['EC2 Instance Error', '"result": "error"', '"decision": "error"',
+                          '"decision": "stop_error"', 'class="error">error'],
+    },
+    'route53-acm': {
+        'file': 'Create-CLIENT-Route53-and-ACM.py',
+        'setup': setup_route53_acm,
+        'events': route53_acm_events,
+    },
+    'vpn-check': {
+        'file': 'check-vpn-on-EC2.py',
+        'setup': setup_vpn_check,
+        'events': vpn_check_events,
+    },
+}
+
+
+def load_handler_module(key):
+    """Import a handler file fresh, the way a Lambda cold start would"""
+    path = os.path.join(HANDLER_DIR, HANDLERS[key]['file'])
+    module_name = f"bench_{key.replace('-', '_')}"
+    sys.modules.pop(module_name, None)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(samples, pct):
+    """Linear-interpolated percentile of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def invoke(module, event, quiet):
+    """Run one invocation, returning (elapsed_seconds, response, exception_text_or_None)"""
+    output = io.StringIO() if quiet else sys.stdout
+    response = None
+    error = None
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        try:
+            response = module.lambda_handler(event, None)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - start, response, error
+
+
+def event_label(event):
+    """Stable name for an event type, so timings are compared per route"""
+    if 'rawPath' in event:
+        method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
+        return f"{method} {event['rawPath']}"
+    if event.get('detail-type'):
+        return event['detail-type']
+    if event.get('action'):
+        return f"action:{event['action']}"
+    return 'event'
+
+
+def latency_stats(samples):
+    """p50/p95/p99/mean in ms for a list of seconds (None when empty)"""
+    def ms(seconds):
+        return round(seconds * 1000, 3) if seconds is not None else None
+
+    return {
+        'p50': ms(percentile(samples, 50)),
+        'p95': ms(percentile(samples, 95)),
+        'p99': ms(percentile(samples, 99)),
+        'mean': ms(statistics.mean(samples)) if samples else None,
+    }
+
+
+def failure_reason(key, response, error, injected):
+    """Why an invocation counts as failed, or None if it succeeded
+
+    Handlers often swallow AWS errors (error pages with status 200, terminate on
+    any exception), so an invocation that saw an injected error is failed even
+    when the handler itself reports success.
+    """
+    if error:
+        return error
+    if isinstance(response, dict):
+        status = response.get('statusCode')
+        if isinstance(status, int) and status >= 500:
+            return f"HTTP {status}"
+        body = response.get('body')
+        if isinstance(body, str):
+            for marker in HANDLERS[key].get('error_markers', []):
+                if marker in body:
+                    return f"error body: {marker}"
+    if injected:
+        return 'injected error handled by handler: ' + ', '.join(sorted(injected))
+    return None
+
+
+def benchmark_handler(key, stand_in, events, args):
+    """Cold starts, warm replay and a traced memory pass for one handler"""
+    quiet = not args.verbose
+    skipped = SkippedSleeps()
+    result = {'handler': key, 'events': len(events)}
+
+    with mock_aws():
+        env = HANDLERS[key]['setup'](boto3.Session(region_name=BENCH_REGION))
+
+        sleep_patch = contextlib.nullcontext() if args.real_sleeps else mock.patch('time.sleep', skipped)
+        with mock.patch.dict(os.environ, env), sleep_patch:
+            # Cold: fresh module import + first event
+            cold_times = []
+            for _ in range(args.cold_starts):
+                # A new default session has an empty botocore loader, so every
+                # sample pays for model loading and client creation again
+                boto3.setup_default_session(region_name=BENCH_REGION)
+                boto3.DEFAULT_SESSION.events.register('before-call', stand_in.before_call)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO() if quiet else sys.stdout):
+                    module = load_handler_module(key)
+                invoke(module, events[0], quiet)
+                cold_times.append(time.perf_counter() - start)
+
+            # Warm: replay the event set --iterations times against the loaded module
+            stand_in.reset()
+            skipped.seconds = 0.0
+            invocations = args.iterations * len(events)
+            warm_times = collections.defaultdict(list)
+            failed_times = collections.defaultdict(list)
+            failures = collections.Counter()
+            for i in range(invocations):
+                event = events[i % len(events)]
+                label = event_label(event)
+                injected_before = stand_in.error_snapshot()
+                elapsed, response, error = invoke(module, event, quiet)
+                injected = stand_in.error_snapshot() - injected_before
+                reason = failure_reason(key, response, error, injected)
+                if reason:
+                    failures[reason] += 1
+                    failed_times[label].append(elapsed)
+                else:
+                    warm_times[label].append(elapsed)
+            warm_calls = dict(stand_in.calls)
+            injected = dict(stand_in.errors)
+            skipped_per_invocation = skipped.seconds / invocations
+
+            # Memory: one traced pass over the event set. moto runs in this process,
+            # so the process peak is mostly moto; handler memory only counts
+            # allocations made by lines in HANDLER_DIR that are alive when the
+            # invocation returns (response body, results, module caches).
+            handler_filter = [tracemalloc.Filter(True, os.path.join(HANDLER_DIR, '*'))]
+            handler_bytes = 0
+            tracemalloc.start()
+            for event in events:
+                _, response, _ = invoke(module, event, quiet)
+                snapshot = tracemalloc.take_snapshot().filter_traces(handler_filter)
+                handler_bytes = max(handler_bytes, sum(stat.size for stat in snapshot.statistics('filename')))
+                del response
+            _, process_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        boto3.DEFAULT_SESSION.events.unregister('before-call', stand_in.before_call)
+
+    # Warm stats cover successful invocations only; failures are reported separately.
+    # Per-event stats are what the baseline gate compares: the handler-wide numbers
+    # mix cheap and expensive routes, so a slow /status would hide behind a fan-out.
+    per_event = {}
+    for label in dict.fromkeys(event_label(e) for e in events):
+        warm = latency_stats(warm_times[label])
+        failed = latency_stats(failed_times[label])
+        per_event[label] = {
+            'invocations': len(warm_times[label]) + len(failed_times[label]),
+            'failed': len(failed_times[label]),
+            **{f'warm_ms_{k}': v for k, v in warm.items()},
+            'failed_ms_p50': failed['p50'],
+        }
+
+    all_warm = latency_stats(sum(warm_times.values(), []))
+    all_failed = latency_stats(sum(failed_times.values(), []))
+    cold_ms = [round(t * 1000, 3) for t in cold_times]
+    result.update({
+        'cold_ms': cold_ms,
+        'cold_ms_mean': round(statistics.mean(cold_ms), 3) if cold_ms else None,
+        'warm_ms_p50': all_warm['p50'],
+        'warm_ms_p95': all_warm['p95'],
+        'warm_ms_p99': all_warm['p99'],
+        'warm_ms_mean': all_warm['mean'],
+        'failed_ms_p50': all_failed['p50'],
+        'failed_ms_p95': all_failed['p95'],
+        'failed_ms_mean': all_failed['mean'],
+        'per_event': per_event,
+        'invocations': invocations,
+        'api_calls_per_invocation': round(sum(warm_calls.values()) / invocations, 3),
+        'api_calls': warm_calls,
+        'injected_errors': injected,
+        'failed_invocations': sum(failures.values()),
+        'failure_reasons': dict(failures.most_common(5)),
+        'skipped_sleep_s_per_invocation': round(skipped_per_invocation, 3),
+        'handler_memory_kib': round(handler_bytes / 1024, 1),
+        'process_peak_kib': round(process_peak / 1024, 1),
+    })
+    return result
+
+
+def load_events(path):
+    with open(path) as f:
+        events = json.load(f)
+    if isinstance(events, dict):
+        events = [events]
+    if not events:
+        raise ValueError(f"No events found in {path}")
+    return events
+
+
+def parse_op_latency(values):
+    """Parse repeated service.Operation=ms overrides"""
+    overrides = {}
+    for value in values or []:
+        operation, _, ms = value.partition('=')
+        if not ms:
+            raise argparse.ArgumentTypeError(f"Expected service.Operation=ms, got {value!r}")
+        overrides[operation] = float(ms)
+    return overrides
+
+
+def compare_to_baseline(results, baseline_path, max_regression, min_regression_ms=0.0):
+    """Return regression messages for per-event warm p95 versus a previous run
+
+    A regression must exceed both max_regression percent and min_regression_ms,
+    so sub-millisecond events do not fail the gate on timer noise.
+    """
+    with open(baseline_path) as f:
+        baseline = {r['handler']: r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous_events = baseline.get(result['handler'], {}).get('per_event', {})
+        for label, stats in result['per_event'].items():
+            previous = previous_events.get(label, {}).get('warm_ms_p95')
+            current = stats['warm_ms_p95']
+            if not previous or current is None:
+                continue
+            change = (current - previous) / previous * 100
+            stats['warm_p95_change_pct'] = round(change, 1)
+            if change > max_regression and current - previous > min_regression_ms:
+                regressions.append(
+                    f"{result['handler']} {label}: warm p95 {previous}ms -> {current}ms ({change:+.1f}%)"
+                )
+    return regressions
+
+
+def print_report(results):
+    def fmt(value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+    header = (f"{'handler':<12} {'cold ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'calls/inv':>9} {'failed':>6} {'fail p50':>9} {'hdlr KiB':>9} {'proc KiB':>9}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(
+            f"{r['handler']:<12} {fmt(r['cold_ms_mean'])} {fmt(r['warm_ms_p50'])} "
+            f"{fmt(r['warm_ms_p95'])} {fmt(r['warm_ms_p99'])} {r['api_calls_per_invocation']:>9.2f} "
+            f"{r['failed_invocations']:>6} {fmt(r['failed_ms_p50'])} {r['handler_memory_kib']:>9.1f} "
+            f"{r['process_peak_kib']:>9.1f}"
+        )
+    for r in results:
+        print(f"\n{r['handler']} per event:")
+        print(f"  {'event':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'failed':>6} {'vs base':>8}")
+        for label, e in r['per_event'].items():
+            change = e.get('warm_p95_change_pct')
+            change_text = f"{change:+.1f}%" if change is not None else '-'
+            print(f"  {label:<28} {fmt(e['warm_ms_p50'])} {fmt(e['warm_ms_p95'])} {fmt(e['warm_ms_p99'])} "
+                  f"{e['failed']:>6} {change_text:>8}")
+        print(f"{r['handler']} API calls ({sum(r['api_calls'].values())} total):")
+        for operation, count in sorted(r['api_calls'].items()):
+            print(f"  {operation:<40} {count}")
+        for reason, count in r['failure_reasons'].items():
+            print(f"  failed x{count}: {reason}")
+        if r['skipped_sleep_s_per_invocation']:
+            print(f"  (skipped {r['skipped_sleep_s_per_invocation']}s of time.sleep per invocation)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmark for the Lambda templates')
+    parser.add_argument('--handler', choices=['all'] + list(HANDLERS), default='all')
+    parser.add_argument('--events', help='JSON file with a recorded event (or list of events) to replay; requires a single --handler')
+    parser.add_argument('--iterations', type=int, default=20, help='Warm invocations per event')
+    parser.add_argument('--cold-starts', type=int, default=3, help='Fresh imports + first invocation per handler')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Injected latency per AWS API call')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Uniform +/- jitter on injected latency')
+    parser.add_argument('--op-latency', action='append', metavar='SERVICE.Operation=MS',
+                        help='Per-operation latency override, e.g. ec2.DescribeInstances=80')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability (0-1) that an API call fails')
+    parser.add_argument('--error-code', default='ThrottlingException', help='Error code used for injected failures')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed for jitter and errors')
+    parser.add_argument('--real-sleeps', action='store_true', help='Do not skip time.sleep calls inside handlers')
+    parser.add_argument('--json', dest='json_path', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Previous --json output to compare per-event warm p95 against')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='Fail (exit 1) when any event\'s warm p95 regresses by more than this percent versus --baseline')
+    parser.add_argument('--min-regression-ms', type=float, default=1.0,
+                        help='Ignore p95 increases smaller than this many ms (timer noise on very fast events)')
+    parser.add_argument('--verbose', action='store_true', help='Show handler output')
+    args = parser.parse_args(argv)
+
+    if args.events and args.handler == 'all':
+        parser.error('--events requires a single --handler')
+    if args.iterations < 1 or args.cold_starts < 1:
+        parser.error('--iterations and --cold-starts must be at least 1')
+
+    use_fake_credentials()
+    keys = list(HANDLERS) if args.handler == 'all' else [args.handler]
+    results = []
+    for key in keys:
+        events = load_events(args.events) if args.events else HANDLERS[key]['events']()
+        stand_in = AwsStandIn(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            error_code=args.error_code,
+            op_latency=parse_op_latency(args.op_latency),
+            seed=args.seed
+        )
+        results.append(benchmark_handler(key, stand_in, events, args))
+
+    regressions = compare_to_baseline(results, args.baseline, args.max_regression, args.min_regression_ms) if args.baseline else []
+
+    print_report(results)
+
+    if args.json_path:
+        config = {k: v for k, v in vars(args).items() if k not in ('json_path', 'baseline')}
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+
+    if regressions:
+        print('\nPerformance regressions:')
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
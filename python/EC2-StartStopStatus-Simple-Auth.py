@@ -4,12 +4,34 @@ import hashlib
 import hmac
 import secrets
 import json
-from datetime import datetime, timedelta
+import html
+from urllib.parse import parse_qs, quote
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 instance_id = os.getenv('INSTANCE_ID')
 region_name = os.getenv('AWS_ALT_REGION')
 ec2 = boto3.client('ec2', region_name=region_name)
 
+# Bulk group actions: instances tagged GROUP_TAG_KEY=<group> in any of MANAGED_REGIONS
+MANAGED_REGIONS = [r.strip() for r in os.getenv('MANAGED_REGIONS', region_name or '').split(',') if r.strip()]
+GROUP_TAG_KEY = os.getenv('GROUP_TAG_KEY', 'ControlPanelGroup')
+EC2_BATCH_SIZE = int(os.getenv('EC2_BATCH_SIZE', '100'))
+
+# Scheduled idle auto-stop: a running managed instance is idle when every period in the
+# lookback window stays below both thresholds
+IDLE_LOOKBACK_MINUTES = int(os.getenv('IDLE_LOOKBACK_MINUTES', '60'))
+IDLE_PERIOD_SECONDS = int(os.getenv('IDLE_PERIOD_SECONDS', '300'))
+IDLE_CPU_PERCENT = float(os.getenv('IDLE_CPU_PERCENT', '5'))
+IDLE_NETWORK_BYTES = float(os.getenv('IDLE_NETWORK_BYTES', '5000000'))
+IDLE_OPT_OUT_TAG_KEY = os.getenv('IDLE_OPT_OUT_TAG_KEY', 'AutoStop')
+IDLE_DRY_RUN = os.getenv('IDLE_DRY_RUN', 'true').lower() != 'false'
+METRIC_QUERIES_PER_REQUEST = 500  # GetMetricData limit
+
+# One client per region, reused across warm invocations
+ec2_clients = {region_name: ec2} if region_name else {}
+cloudwatch_clients = {}
+
 AUTH_USERNAME = os.getenv('AUTH_USERNAME', 'lechu')
 AUTH_PASSWORD_HASH = os.getenv('AUTH_PASSWORD_HASH', '')
 SESSION_SECRET = os.getenv('SESSION_SECRET', secrets.token_hex(32))
@@ -50,6 +72,360 @@ def verify_credentials(username, password):
         return hmac.compare_digest(password_hash, AUTH_PASSWORD_HASH)
     return False
 
+def get_ec2_client(region):
+    """Return a cached EC2 client for the region"""
+    if region not in ec2_clients:
+        ec2_clients[region] = boto3.client('ec2', region_name=region)
+    return ec2_clients[region]
+
+def chunks(items, size):
+    """Split a list into lists of at most size items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def find_group_instances(client, group):
+    """List (instance_id, name, state) for instances tagged with the group"""
+    instances = []
+    paginator = client.get_paginator('describe_instances')
+    for page in paginator.paginate(Filters=[
+        {'Name': f'tag:{GROUP_TAG_KEY}', 'Values': [group]},
+        {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']}
+    ]):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+                instances.append((instance['InstanceId'], tags.get('Name', ''), instance['State']['Name']))
+    return instances
+
+def run_region_action(region, client, action, group):
+    """Apply start/stop/status to one region's group members, batched by EC2_BATCH_SIZE"""
+    results = []
+    try:
+        instances = find_group_instances(client, group)
+    except Exception as e:
+        print(f"Error listing group {group} in {region}: {e}")
+        return [{'region': region, 'instance_id': '-', 'name': '', 'previous_state': '-',
+                 'current_state': '-', 'result': 'error', 'error': str(e)}]
+
+    # Only send instances that can actually change state
+    actionable_state = {'start': 'stopped', 'stop': 'running'}.get(action)
+    names = {}
+    to_change = []
+    for iid, name, state in instances:
+        names[iid] = name
+        if state == actionable_state:
+            to_change.append(iid)
+        else:
+            results.append({'region': region, 'instance_id': iid, 'name': name, 'previous_state': state,
+                            'current_state': state, 'result': 'unchanged' if action == 'status' else 'skipped'})
+
+    for batch in chunks(to_change, EC2_BATCH_SIZE):
+        try:
+            if action == 'start':
+                changes = client.start_instances(InstanceIds=batch)['StartingInstances']
+            else:
+                changes = client.stop_instances(InstanceIds=batch)['StoppingInstances']
+            for change in changes:
+                results.append({'region': region, 'instance_id': change['InstanceId'],
+                                'name': names.get(change['InstanceId'], ''),
+                                'previous_state': change['PreviousState']['Name'],
+                                'current_state': change['CurrentState']['Name'], 'result': 'ok'})
+        except Exception as e:
+            print(f"Error on {action} for {len(batch)} instances in {region}: {e}")
+            for iid in batch:
+                results.append({'region': region, 'instance_id': iid, 'name': names.get(iid, ''),
+                                'previous_state': actionable_state, 'current_state': actionable_state,
+                                'result': 'error', 'error': str(e)})
+    return results
+
+def run_group_action(action, group):
+    """Run a group action across MANAGED_REGIONS concurrently, one worker per region"""
+    # Clients are created here, not in the workers: client creation is not thread-safe
+    clients = {region: get_ec2_client(region) for region in MANAGED_REGIONS}
+    if not clients:
+        return []
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        futures = [executor.submit(run_region_action, region, client, action, group)
+                   for region, client in clients.items()]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+    return results
+
+def get_cloudwatch_client(region):
+    """Return a cached CloudWatch client for the region"""
+    if region not in cloudwatch_clients:
+        cloudwatch_clients[region] = boto3.client('cloudwatch', region_name=region)
+    return cloudwatch_clients[region]
+
+def is_idle_check_event(event):
+    """True for an EventBridge schedule or a {"action": "idle-check"} constant input"""
+    return event.get('detail-type') == 'Scheduled Event' or event.get('action') == 'idle-check'
+
+def find_running_managed_instances(client, group=None):
+    """List running instances carrying GROUP_TAG_KEY (any value, or the given group)"""
+    tag_filter = {'Name': f'tag:{GROUP_TAG_KEY}', 'Values': [group]} if group else {'Name': 'tag-key', 'Values': [GROUP_TAG_KEY]}
+    instances = []
+    paginator = client.get_paginator('describe_instances')
+    for page in paginator.paginate(Filters=[tag_filter, {'Name': 'instance-state-name', 'Values': ['running']}]):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+                instances.append({'instance_id': instance['InstanceId'], 'name': tags.get('Name', ''),
+                                  'launch_time': instance['LaunchTime'], 'tags': tags})
+    return instances
+
+def fetch_idle_metrics(client, instance_ids, start_time, end_time):
+    """Fetch CPU and network for all instances with batched GetMetricData requests
+
+    Returns {instance_id: {'cpu', 'network_in', 'network_out', 'network'}} where each
+    list holds one value per period. network is NetworkIn + NetworkOut bytes, only
+    for periods where both metrics have a value.
+    """
+    queries = []
+    owners = {}
+    for n, iid in enumerate(instance_ids):
+        for prefix, metric, stat in (('cpu', 'CPUUtilization', 'Average'),
+                                     ('nin', 'NetworkIn', 'Sum'),
+                                     ('nout', 'NetworkOut', 'Sum')):
+            query_id = f'{prefix}_{n}'
+            owners[query_id] = (iid, prefix)
+            queries.append({
+                'Id': query_id,
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/EC2',
+                        'MetricName': metric,
+                        'Dimensions': [{'Name': 'InstanceId', 'Value': iid}]
+                    },
+                    'Period': IDLE_PERIOD_SECONDS,
+                    'Stat': stat
+                },
+                'ReturnData': True
+            })
+
+    series = {iid: {'cpu': {}, 'nin': {}, 'nout': {}} for iid in instance_ids}
+    paginator = client.get_paginator('get_metric_data')
+    for batch in chunks(queries, METRIC_QUERIES_PER_REQUEST):
+        for page in paginator.paginate(MetricDataQueries=batch, StartTime=start_time, EndTime=end_time):
+            for result in page['MetricDataResults']:
+                iid, prefix = owners[result['Id']]
+                series[iid][prefix].update(zip(result['Timestamps'], result['Values']))
+
+    metrics = {}
+    for iid, data in series.items():
+        # Only periods where both directions reported; one alone could hide traffic
+        network = [value + data['nout'][timestamp] for timestamp, value in data['nin'].items()
+                   if timestamp in data['nout']]
+        metrics[iid] = {
+            'cpu': list(data['cpu'].values()),
+            'network_in': list(data['nin'].values()),
+            'network_out': list(data['nout'].values()),
+            'network': network
+        }
+    return metrics
+
+def check_region_idle(region, ec2_client, cloudwatch_client, group, dry_run, now):
+    """Evaluate and (unless dry run) stop idle managed instances in one region"""
+    try:
+        instances = find_running_managed_instances(ec2_client, group)
+        start_time = now - timedelta(minutes=IDLE_LOOKBACK_MINUTES)
+        metrics = fetch_idle_metrics(cloudwatch_client, [i['instance_id'] for i in instances], start_time, now) if instances else {}
+    except Exception as e:
+        print(f"Error evaluating idle instances in {region}: {e}")
+        return [{'region': region, 'instance_id': '-', 'name': '', 'decision': 'error', 'error': str(e)}]
+
+    min_datapoints = max(1, IDLE_LOOKBACK_MINUTES * 60 // IDLE_PERIOD_SECONDS // 2)
+    results = []
+    idle_ids = []
+    for instance in instances:
+        iid = instance['instance_id']
+        cpu = metrics.get(iid, {}).get('cpu', [])
+        network_in = metrics.get(iid, {}).get('network_in', [])
+        network_out = metrics.get(iid, {}).get('network_out', [])
+        network = metrics.get(iid, {}).get('network', [])
+        result = {
+            'region': region,
+            'instance_id': iid,
+            'name': instance['name'],
+            'max_cpu_percent': round(max(cpu), 2) if cpu else None,
+            'max_network_bytes': round(max(network)) if network else None,
+            'cpu_datapoints': len(cpu),
+            'network_in_datapoints': len(network_in),
+            'network_out_datapoints': len(network_out),
+            'network_datapoints': len(network)
+        }
+        if instance['tags'].get(IDLE_OPT_OUT_TAG_KEY, '').lower() == 'false':
+            result['decision'] = 'opted_out'
+        elif instance['launch_time'] > start_time:
+            result['decision'] = 'too_new'
+        elif min(len(cpu), len(network_in), len(network_out), len(network)) < min_datapoints:
+            result['decision'] = 'insufficient_data'
+        elif max(cpu) < IDLE_CPU_PERCENT and max(network) < IDLE_NETWORK_BYTES:
+            result['decision'] = 'would_stop' if dry_run else 'stopped'
+            idle_ids.append(iid)
+        else:
+            result['decision'] = 'active'
+        results.append(result)
+
+    if not dry_run:
+        by_id = {r['instance_id']: r for r in results}
+        for batch in chunks(idle_ids, EC2_BATCH_SIZE):
+            try:
+                ec2_client.stop_instances(InstanceIds=batch)
+            except Exception as e:
+                print(f"Error stopping {len(batch)} idle instances in {region}: {e}")
+                for iid in batch:
+                    by_id[iid]['decision'] = 'stop_error'
+                    by_id[iid]['error'] = str(e)
+    return results
+
+def parse_dry_run(value):
+    """Live run only for an explicit false; anything else falls back to IDLE_DRY_RUN"""
+    if value is False or (isinstance(value, str) and value.strip().lower() == 'false'):
+        return False
+    if value is True or (isinstance(value, str) and value.strip().lower() == 'true'):
+        return True
+    return IDLE_DRY_RUN
+
+def run_idle_check(event):
+    """Scheduled idle detection across MANAGED_REGIONS; returns the report as JSON"""
+    options = event.get('detail') if event.get('detail-type') == 'Scheduled Event' else event
+    options = options or {}
+    dry_run = parse_dry_run(options.get('dryRun'))
+    group = options.get('group')
+    now = datetime.now(timezone.utc)
+
+    clients = {region: (get_ec2_client(region), get_cloudwatch_client(region)) for region in MANAGED_REGIONS}
+    results = []
+    if clients:
+        with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+            futures = [executor.submit(check_region_idle, region, ec2_client, cloudwatch_client, group, dry_run, now)
+                       for region, (ec2_client, cloudwatch_client) in clients.items()]
+            for future in futures:
+                results.extend(future.result())
+
+    summary = {}
+    for result in results:
+        summary[result['decision']] = summary.get(result['decision'], 0) + 1
+    print(f"Idle check ({'dry run' if dry_run else 'live'}) for {group or 'all groups'}: {summary}")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'dry_run': dry_run,
+            'group': group,
+            'regions': MANAGED_REGIONS,
+            'policy': {
+                'lookback_minutes': IDLE_LOOKBACK_MINUTES,
+                'period_seconds': IDLE_PERIOD_SECONDS,
+                'cpu_percent_below': IDLE_CPU_PERCENT,
+                'network_bytes_below': IDLE_NETWORK_BYTES,
+                'opt_out_tag': f'{IDLE_OPT_OUT_TAG_KEY}=false'
+            },
+            'summary': summary,
+            'instances': results
+        })
+    }
+
+def create_group_page(action, group, results):
+    """Return the bulk action results page HTML"""
+    rows = ''.join(
+        f"<tr><td>{r['region']}</td><td>{r['instance_id']}</td><td>{html.escape(r['name'])}</td>"
+        f"<td>{r['previous_state']}</td><td>{r['current_state']}</td>"
+        f"<td class=\"{r['result']}\">{r['result']}{': ' + html.escape(r['error']) if r.get('error') else ''}</td></tr>"
+        for r in results
+    ) or '<tr><td colspan="6">No instances found for this group.</td></tr>'
+    group_html = html.escape(group)
+    group_query = quote(group, safe='')
+
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>EC2 Group {action.title()}</title>
+    <style>
+        body {{
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            max-width: 1000px;
+            margin: 0 auto;
+            padding: 20px;
+            background: #f5f5f5;
+        }}
+        .container {{
+            background: white;
+            padding: 30px;
+            border-radius: 10px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        }}
+        h1 {{
+            color: #0066cc;
+            border-bottom: 2px solid #0066cc;
+            padding-bottom: 10px;
+        }}
+        table {{
+            width: 100%;
+            border-collapse: collapse;
+            margin-top: 20px;
+        }}
+        th, td {{
+            border: 1px solid #dee2e6;
+            padding: 8px;
+            text-align: left;
+            font-size: 14px;
+        }}
+        th {{
+            background-color: #f8f9fa;
+        }}
+        .ok {{
+            color: #009900;
+        }}
+        .error {{
+            color: #cc0000;
+        }}
+        .actions {{
+            margin-top: 20px;
+            text-align: center;
+        }}
+        .btn {{
+            display: inline-block;
+            padding: 10px 20px;
+            margin: 0 10px;
+            text-decoration: none;
+            border-radius: 5px;
+            font-weight: bold;
+            color: white;
+        }}
+        .btn-start {{
+            background: #28a745;
+        }}
+        .btn-stop {{
+            background: #dc3545;
+        }}
+        .btn-status {{
+            background: #0066cc;
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Group {group_html}: {action}</h1>
+        <p><strong>Regions:</strong> {', '.join(MANAGED_REGIONS)}</p>
+        <table>
+            <tr><th>Region</th><th>Instance ID</th><th>Name</th><th>Previous State</th><th>Current State</th><th>Result</th></tr>
+            {rows}
+        </table>
+        <div class="actions">
+            <a href="/group/start?group={group_query}" class="btn btn-start">Start Group</a>
+            <a href="/group/stop?group={group_query}" class="btn btn-stop">Stop Group</a>
+            <a href="/group/status?group={group_query}" class="btn btn-status">Group Status</a>
+        </div>
+    </div>
+</body>
+</html>"""
+
 def create_login_page(error_message=''):
     """Return login page HTML"""
     error_html = f'<div class="error">{error_message}</div>' if error_message else ''
@@ -183,7 +559,11 @@ def create_login_page(error_message=''):
 
 def lambda_handler(event, context):
     print(f"Event: {json.dumps(event)}")
-    
+
+    # Scheduled idle check (EventBridge) - no HTTP routing or auth
+    if is_idle_check_event(event):
+        return run_idle_check(event)
+
     # Get path and method
     path = event.get('rawPath', '/').lower()
     method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
@@ -251,7 +631,47 @@ def lambda_handler(event, context):
     
     # Handle EC2 operations
     try:
-        if path == '/start':
+        if path.startswith('/group/'):
+            params = event.get('queryStringParameters') or {
+                key: values[0] for key, values in parse_qs(event.get('rawQueryString', '')).items()
+            }
+            group = params.get('group', '')
+            action = path[len('/group/'):]
+
+            if action not in ('start', 'stop', 'status'):
+                action_message = "Invalid group action. Please use /group/start, /group/stop, or /group/status."
+            elif not group:
+                action_message = "Missing group. Add ?group=&lt;name&gt; to the URL."
+            else:
+                results = run_group_action(action, group)
+                summary = {}
+                for result in results:
+                    summary[result['result']] = summary.get(result['result'], 0) + 1
+                print(f"Group {action} for {group}: {summary}")
+
+                if params.get('format') == 'json' or 'application/json' in headers.get('accept', ''):
+                    return {
+                        'statusCode': 200,
+                        'headers': {
+                            'Content-Type': 'application/json'
+                        },
+                        'body': json.dumps({
+                            'group': group,
+                            'action': action,
+                            'regions': MANAGED_REGIONS,
+                            'summary': summary,
+                            'instances': results
+                        })
+                    }
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'text/html; charset=utf-8'
+                    },
+                    'body': create_group_page(action, group, results)
+                }
+
+        elif path == '/start':
             ec2.start_instances(InstanceIds=[instance_id])
             action_message = f"Instance {instance_id} is starting."
         
@@ -0,0 +1,79 @@
+"""Shared moto fixtures for the Lambda template tests.
+
+The handlers are single-file Lambdas with hyphenated names, so they are loaded
+by path instead of imported. Requirements:
+    pip install pytest boto3 "moto[ec2,cloudwatch]"
+"""
+import importlib.util
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PANEL_PATH = os.path.join(REPO_ROOT, 'python', 'EC2-StartStopStatus-Simple-Auth.py')
+GROUP_TAG_KEY = 'ControlPanelGroup'
+
+
+@pytest.fixture(autouse=True)
+def aws_credentials(monkeypatch):
+    """Fake credentials so nothing can reach real AWS"""
+    for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SECURITY_TOKEN', 'AWS_SESSION_TOKEN'):
+        monkeypatch.setenv(key, 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+@pytest.fixture
+def aws():
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def load_panel(aws, monkeypatch):
+    """Load the EC2 control panel module fresh with the given environment"""
+    def load(**env):
+        defaults = {
+            'INSTANCE_ID': 'i-00000000000000000',
+            'AWS_ALT_REGION': 'us-east-1',
+            'MANAGED_REGIONS': 'us-east-1',
+            'GROUP_TAG_KEY': GROUP_TAG_KEY,
+            'AUTH_PASSWORD_HASH': '',
+        }
+        defaults.update(env)
+        for key, value in defaults.items():
+            monkeypatch.setenv(key, value)
+        spec = importlib.util.spec_from_file_location('ec2_control_panel', PANEL_PATH)
+        module = importlib.util.module_from_spec(spec)
+        monkeypatch.setitem(sys.modules, 'ec2_control_panel', module)
+        spec.loader.exec_module(module)
+        return module
+    return load
+
+
+def launch(region, count=1, tags=None, stopped=False):
+    """Launch moto instances and return their IDs"""
+    ec2 = boto3.client('ec2', region_name=region)
+    params = {'ImageId': 'ami-12c6146b', 'InstanceType': 't3.micro', 'MinCount': count, 'MaxCount': count}
+    if tags:
+        params['TagSpecifications'] = [{
+            'ResourceType': 'instance',
+            'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]
+        }]
+    ids = [i['InstanceId'] for i in ec2.run_instances(**params)['Instances']]
+    if stopped:
+        ec2.stop_instances(InstanceIds=ids)
+    return ids
+
+
+def record_batches(client, operation):
+    """Collect the InstanceIds list of every call to an EC2 operation on this client"""
+    batches = []
+
+    def handler(params, **kwargs):
+        batches.append(list(params['InstanceIds']))
+
+    client.meta.events.register(f'provide-client-params.ec2.{operation}', handler)
+    return batches
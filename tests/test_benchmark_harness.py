@@ -0,0 +1,119 @@
+import collections
+import importlib.util
+import json
+import os
+import threading
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import REPO_ROOT
+
+spec = importlib.util.spec_from_file_location('benchmark_handlers', os.path.join(REPO_ROOT, 'bench', 'benchmark_handlers.py'))
+bench = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench)
+
+
+def make_stand_in(seed=7, error_rate=0.5):
+    """Stand-in hooked into a fresh session; returns (stand_in, session)"""
+    stand_in = bench.AwsStandIn(error_rate=error_rate, seed=seed)
+    session = boto3.Session(region_name='us-east-1')
+    session.events.register('before-call', stand_in.before_call)
+    return stand_in, session
+
+
+def call_many(client, outcomes, count=20):
+    for _ in range(count):
+        try:
+            client.describe_instances()
+            outcomes.append('ok')
+        except ClientError:
+            outcomes.append('error')
+
+
+def run_threads(seed):
+    """Call DescribeInstances in three regions at once and return per-region outcomes"""
+    stand_in, session = make_stand_in(seed)
+    # Clients are created up front: client creation is not thread-safe
+    clients = {region: session.client('ec2', region_name=region)
+               for region in ('us-east-1', 'us-west-2', 'eu-west-1')}
+    outcomes = {region: [] for region in clients}
+    threads = [threading.Thread(target=call_many, args=(client, outcomes[region]))
+               for region, client in clients.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stand_in, outcomes
+
+
+def test_same_seed_injects_same_errors_across_threads(aws):
+    first_stand_in, first = run_threads(seed=11)
+    second_stand_in, second = run_threads(seed=11)
+
+    assert first == second
+    assert first_stand_in.calls == second_stand_in.calls == collections.Counter({'ec2.DescribeInstances': 60})
+    assert first_stand_in.errors == second_stand_in.errors
+    assert sum(first_stand_in.errors.values()) == sum(o.count('error') for o in first.values())
+
+
+def test_injected_error_counts_as_failure_even_when_handled():
+    injected = collections.Counter({'ec2.DescribeInstances': 1})
+
+    reason = bench.failure_reason('ec2-panel', {'statusCode': 200, 'body': 'ok'}, None, injected)
+
+    assert reason == 'injected error handled by handler: ec2.DescribeInstances'
+
+
+@pytest.mark.parametrize('response, error, expected', [
+    (None, 'RuntimeError: boom', 'RuntimeError: boom'),
+    ({'statusCode': 502, 'body': ''}, None, 'HTTP 502'),
+    ({'statusCode': 200, 'body': '<title>EC2 Instance Error</title>'}, None, 'error body: EC2 Instance Error'),
+    ({'statusCode': 200, 'body': '{"decision": "stop_error"}'}, None, 'error body: "decision": "stop_error"'),
+    ({'statusCode': 200, 'body': '<p>fine</p>'}, None, None),
+])
+def test_failure_reason(response, error, expected):
+    assert bench.failure_reason('ec2-panel', response, error, collections.Counter()) == expected
+
+
+def test_percentile_interpolates():
+    assert bench.percentile([1, 2, 3, 4], 50) == 2.5
+    assert bench.percentile([5], 99) == 5
+    assert bench.percentile([], 50) is None
+
+
+def test_event_label():
+    http = {'rawPath': '/status', 'requestContext': {'http': {'method': 'GET'}}}
+    assert bench.event_label(http) == 'GET /status'
+    assert bench.event_label({'detail-type': 'Scheduled Event', 'detail': {}}) == 'Scheduled Event'
+    assert bench.event_label({'action': 'idle-check'}) == 'action:idle-check'
+    assert bench.event_label({}) == 'event'
+
+
+def per_event_result(**p95s):
+    return {'handler': 'ec2-panel', 'per_event': {label: {'warm_ms_p95': p95} for label, p95 in p95s.items()}}
+
+
+def test_baseline_gate_compares_each_event(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps({'results': [per_event_result(status=10.0, fanout=200.0, login=0.1)]}))
+    # /status doubles while the slow fan-out dominates any handler-wide p95
+    current = per_event_result(status=20.0, fanout=190.0, login=0.2)
+
+    regressions = bench.compare_to_baseline([current], str(baseline), max_regression=20, min_regression_ms=1.0)
+
+    assert regressions == ['ec2-panel status: warm p95 10.0ms -> 20.0ms (+100.0%)']
+    assert current['per_event']['fanout']['warm_p95_change_pct'] == -5.0
+    assert current['per_event']['login']['warm_p95_change_pct'] == 100.0
+
+
+def test_import_has_no_environment_side_effects(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'ap-south-1')
+    monkeypatch.delenv('AWS_SESSION_TOKEN', raising=False)
+
+    fresh = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fresh)
+
+    assert os.environ['AWS_DEFAULT_REGION'] == 'ap-south-1'
+    assert 'AWS_SESSION_TOKEN' not in os.environ
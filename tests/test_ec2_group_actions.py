@@ -0,0 +1,103 @@
+import json
+
+from conftest import GROUP_TAG_KEY, launch, record_batches
+
+
+def group_event(action, query):
+    return {
+        'rawPath': f'/group/{action}',
+        'rawQueryString': query,
+        'requestContext': {'http': {'method': 'GET'}},
+        'headers': {}
+    }
+
+
+def call_group(panel, action, group='nightly'):
+    response = panel.lambda_handler(group_event(action, f'group={group}&format=json'), None)
+    assert response['headers']['Content-Type'] == 'application/json'
+    return json.loads(response['body'])
+
+
+def test_stop_batches_per_region_and_skips_stopped(load_panel):
+    east_running = launch('us-east-1', 5, {GROUP_TAG_KEY: 'nightly'})
+    launch('us-east-1', 1, {GROUP_TAG_KEY: 'nightly'}, stopped=True)
+    west_running = launch('eu-west-1', 3, {GROUP_TAG_KEY: 'nightly'})
+    launch('eu-west-1', 2, {GROUP_TAG_KEY: 'other'})
+    launch('eu-west-1', 1)
+
+    panel = load_panel(MANAGED_REGIONS='us-east-1,eu-west-1', EC2_BATCH_SIZE='2')
+    east_batches = record_batches(panel.get_ec2_client('us-east-1'), 'StopInstances')
+    west_batches = record_batches(panel.get_ec2_client('eu-west-1'), 'StopInstances')
+
+    body = call_group(panel, 'stop')
+
+    assert [len(b) for b in east_batches] == [2, 2, 1]
+    assert [len(b) for b in west_batches] == [2, 1]
+    assert sorted(sum(east_batches, [])) == sorted(east_running)
+    assert sorted(sum(west_batches, [])) == sorted(west_running)
+    assert body['summary'] == {'ok': 8, 'skipped': 1}
+    assert {r['region'] for r in body['instances']} == {'us-east-1', 'eu-west-1'}
+
+
+def test_start_only_sends_stopped_instances(load_panel):
+    launch('us-east-1', 2, {GROUP_TAG_KEY: 'nightly'})
+    stopped = launch('us-east-1', 3, {GROUP_TAG_KEY: 'nightly'}, stopped=True)
+
+    panel = load_panel(EC2_BATCH_SIZE='100')
+    batches = record_batches(panel.get_ec2_client('us-east-1'), 'StartInstances')
+
+    body = call_group(panel, 'start')
+
+    assert len(batches) == 1
+    assert sorted(batches[0]) == sorted(stopped)
+    assert body['summary'] == {'ok': 3, 'skipped': 2}
+
+
+def test_status_makes_no_state_changes(load_panel):
+    launch('us-east-1', 2, {GROUP_TAG_KEY: 'nightly'})
+    launch('us-east-1', 1, {GROUP_TAG_KEY: 'nightly'}, stopped=True)
+
+    panel = load_panel()
+    client = panel.get_ec2_client('us-east-1')
+    calls = record_batches(client, 'StartInstances') + record_batches(client, 'StopInstances')
+
+    body = call_group(panel, 'status')
+
+    assert calls == []
+    assert body['summary'] == {'unchanged': 3}
+
+
+def test_failed_batch_is_reported_per_instance(load_panel, monkeypatch):
+    launch('us-east-1', 3, {GROUP_TAG_KEY: 'nightly'})
+    west = launch('eu-west-1', 2, {GROUP_TAG_KEY: 'nightly'})
+
+    panel = load_panel(MANAGED_REGIONS='us-east-1,eu-west-1')
+
+    def fail(**kwargs):
+        raise RuntimeError('throttled')
+
+    monkeypatch.setattr(panel.get_ec2_client('eu-west-1'), 'stop_instances', fail)
+
+    body = call_group(panel, 'stop')
+
+    errors = [r for r in body['instances'] if r['result'] == 'error']
+    assert sorted(r['instance_id'] for r in errors) == sorted(west)
+    assert all(r['error'] == 'throttled' for r in errors)
+    assert body['summary'] == {'ok': 3, 'error': 2}
+
+
+def test_missing_group_shows_message(load_panel):
+    panel = load_panel()
+
+    response = panel.lambda_handler(group_event('stop', ''), None)
+
+    assert 'Missing group' in response['body']
+
+
+def test_html_page_escapes_group_name(load_panel):
+    panel = load_panel()
+
+    response = panel.lambda_handler(group_event('status', 'group=%3Cscript%3E'), None)
+
+    assert '<script>' not in response['body']
+    assert '&lt;script&gt;' in response['body']
@@ -0,0 +1,208 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+
+from conftest import GROUP_TAG_KEY, launch, record_batches
+
+# Evaluate two hours ahead so freshly launched moto instances are older than the
+# 60 minute lookback window
+NOW = datetime.now(timezone.utc) + timedelta(hours=2)
+
+
+def put_metrics(region, instance_id, cpu, network=None, periods=12, network_out=True):
+    """Write one datapoint per 5 minute period inside the lookback window"""
+    cloudwatch = boto3.client('cloudwatch', region_name=region)
+    metrics = [('CPUUtilization', cpu)]
+    if network is not None:
+        metrics.append(('NetworkIn', network))
+        if network_out:
+            metrics.append(('NetworkOut', network))
+    for name, value in metrics:
+        cloudwatch.put_metric_data(Namespace='AWS/EC2', MetricData=[{
+            'MetricName': name,
+            'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}],
+            'Timestamp': NOW - timedelta(minutes=5 * k + 1),
+            'Value': value
+        } for k in range(periods)])
+
+
+def setup_fleet(region='us-east-1'):
+    """One instance per decision; returns {decision: instance_id}"""
+    tags = {GROUP_TAG_KEY: 'nightly'}
+    fleet = {
+        'idle': launch(region, 1, tags)[0],
+        'busy_cpu': launch(region, 1, tags)[0],
+        'busy_network': launch(region, 1, tags)[0],
+        'opted_out': launch(region, 1, dict(tags, AutoStop='false'))[0],
+        'no_network': launch(region, 1, tags)[0],
+        'network_in_only': launch(region, 1, tags)[0],
+        'sparse': launch(region, 1, tags)[0],
+    }
+    put_metrics(region, fleet['idle'], cpu=1.0, network=1000.0)
+    put_metrics(region, fleet['busy_cpu'], cpu=50.0, network=1000.0)
+    put_metrics(region, fleet['busy_network'], cpu=1.0, network=10000000.0)
+    put_metrics(region, fleet['opted_out'], cpu=1.0, network=1000.0)
+    put_metrics(region, fleet['no_network'], cpu=1.0)
+    put_metrics(region, fleet['network_in_only'], cpu=1.0, network=1000.0, network_out=False)
+    put_metrics(region, fleet['sparse'], cpu=1.0, network=1000.0, periods=2)
+    launch(region, 1)  # unmanaged, never evaluated
+    return fleet
+
+
+def decisions(results):
+    return {r['instance_id']: r['decision'] for r in results}
+
+
+def instance_state(region, instance_id):
+    ec2 = boto3.client('ec2', region_name=region)
+    return ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]['State']['Name']
+
+
+def check(panel, region='us-east-1', dry_run=True, group=None):
+    return panel.check_region_idle(region, panel.get_ec2_client(region), panel.get_cloudwatch_client(region),
+                                   group, dry_run, NOW)
+
+
+def test_dry_run_decision_table(load_panel):
+    fleet = setup_fleet()
+    panel = load_panel()
+
+    results = check(panel)
+
+    assert decisions(results) == {
+        fleet['idle']: 'would_stop',
+        fleet['busy_cpu']: 'active',
+        fleet['busy_network']: 'active',
+        fleet['opted_out']: 'opted_out',
+        fleet['no_network']: 'insufficient_data',
+        fleet['network_in_only']: 'insufficient_data',
+        fleet['sparse']: 'insufficient_data',
+    }
+    assert instance_state('us-east-1', fleet['idle']) == 'running'
+
+
+def test_missing_network_data_is_never_idle(load_panel):
+    fleet = setup_fleet()
+    panel = load_panel()
+
+    result = next(r for r in check(panel, dry_run=False) if r['instance_id'] == fleet['no_network'])
+
+    assert result['decision'] == 'insufficient_data'
+    assert result['cpu_datapoints'] == 12
+    assert result['network_datapoints'] == 0
+    assert instance_state('us-east-1', fleet['no_network']) == 'running'
+
+
+def test_one_network_direction_is_never_idle(load_panel):
+    fleet = setup_fleet()
+    panel = load_panel()
+
+    result = next(r for r in check(panel, dry_run=False) if r['instance_id'] == fleet['network_in_only'])
+
+    assert result['decision'] == 'insufficient_data'
+    assert result['network_in_datapoints'] == 12
+    assert result['network_out_datapoints'] == 0
+    assert result['network_datapoints'] == 0
+    assert instance_state('us-east-1', fleet['network_in_only']) == 'running'
+
+
+def test_live_run_stops_only_idle_instances(load_panel):
+    fleet = setup_fleet()
+    panel = load_panel()
+
+    results = check(panel, dry_run=False)
+
+    assert decisions(results)[fleet['idle']] == 'stopped'
+    assert instance_state('us-east-1', fleet['idle']) in ('stopping', 'stopped')
+    for name, instance_id in fleet.items():
+        if name != 'idle':
+            assert instance_state('us-east-1', instance_id) == 'running'
+
+
+def test_one_metric_request_and_batched_stops(load_panel):
+    tags = {GROUP_TAG_KEY: 'nightly'}
+    idle = launch('us-east-1', 5, tags)
+    for instance_id in idle:
+        put_metrics('us-east-1', instance_id, cpu=1.0, network=1000.0)
+    panel = load_panel(EC2_BATCH_SIZE='2')
+
+    metric_requests = []
+    panel.get_cloudwatch_client('us-east-1').meta.events.register(
+        'provide-client-params.cloudwatch.GetMetricData',
+        lambda params, **kwargs: metric_requests.append(len(params['MetricDataQueries']))
+    )
+    batches = record_batches(panel.get_ec2_client('us-east-1'), 'StopInstances')
+
+    check(panel, dry_run=False)
+
+    assert metric_requests == [15]
+    assert [len(b) for b in batches] == [2, 2, 1]
+    assert sorted(sum(batches, [])) == sorted(idle)
+
+
+def test_failed_stop_is_reported(load_panel, monkeypatch):
+    fleet = setup_fleet()
+    panel = load_panel()
+
+    def fail(**kwargs):
+        raise RuntimeError('throttled')
+
+    monkeypatch.setattr(panel.get_ec2_client('us-east-1'), 'stop_instances', fail)
+
+    result = next(r for r in check(panel, dry_run=False) if r['instance_id'] == fleet['idle'])
+
+    assert result['decision'] == 'stop_error'
+    assert result['error'] == 'throttled'
+
+
+def test_scheduled_event_skips_new_instances(load_panel):
+    new = launch('eu-west-1', 1, {GROUP_TAG_KEY: 'nightly'})[0]
+    panel = load_panel(MANAGED_REGIONS='us-east-1,eu-west-1')
+
+    response = panel.lambda_handler({'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {}}, None)
+    body = json.loads(response['body'])
+
+    assert body['dry_run'] is True
+    assert decisions(body['instances']) == {new: 'too_new'}
+
+
+def test_constant_input_overrides_dry_run_and_group(load_panel):
+    launch('us-east-1', 1, {GROUP_TAG_KEY: 'nightly'})
+    other = launch('us-east-1', 1, {GROUP_TAG_KEY: 'other'})[0]
+    panel = load_panel()
+
+    response = panel.lambda_handler({'action': 'idle-check', 'dryRun': 'false', 'group': 'other'}, None)
+    body = json.loads(response['body'])
+
+    assert body['dry_run'] is False
+    assert body['group'] == 'other'
+    assert [r['instance_id'] for r in body['instances']] == [other]
+
+
+@pytest.mark.parametrize('value, env, expected', [
+    (False, 'true', False),
+    ('false', 'true', False),
+    (' FALSE ', 'true', False),
+    (True, 'false', True),
+    ('true', 'false', True),
+    (None, 'true', True),
+    (None, 'false', False),
+    (0, 'true', True),
+    ('', 'true', True),
+    ('no', 'true', True),
+])
+def test_dry_run_only_goes_live_on_explicit_false(load_panel, value, env, expected):
+    panel = load_panel(IDLE_DRY_RUN=env)
+
+    assert panel.parse_dry_run(value) is expected
+
+
+def test_null_dry_run_does_not_stop_instances(load_panel):
+    launch('us-east-1', 1, {GROUP_TAG_KEY: 'nightly'})
+    panel = load_panel(IDLE_DRY_RUN='true')
+
+    response = panel.lambda_handler({'action': 'idle-check', 'dryRun': None}, None)
+
+    assert json.loads(response['body'])['dry_run'] is True